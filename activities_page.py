@@ -0,0 +1,8 @@
+import msgspec
+
+from activity_item import ActivityItem
+
+
+class ActivitiesPage(msgspec.Struct, rename="camel"):
+    items: list[ActivityItem]
+    pagination_token: str | None
\ No newline at end of file
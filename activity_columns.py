@@ -0,0 +1,10 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class ActivityColumns:
+    date: np.ndarray
+    xp_reward: np.ndarray
+    user_id: np.ndarray
\ No newline at end of file
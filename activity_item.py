@@ -1,9 +1,7 @@
-from dataclasses import dataclass
+import msgspec
 
 
-@dataclass
-class ActivityItem:
-    userId: str
-    type: int
-    xpReward: int
-    recordedAt: str
\ No newline at end of file
+class ActivityItem(msgspec.Struct, rename="camel", gc=False):
+    user_id: str
+    xp_reward: int
+    recorded_at: str
\ No newline at end of file
@@ -0,0 +1,7 @@
+import msgspec
+
+from member import Member
+
+
+class ClubMember(msgspec.Struct):
+    user: Member
\ No newline at end of file
@@ -1,23 +1,34 @@
 import argparse
-from collections import defaultdict
-from datetime import datetime
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
 import os
 import sys
 import time
-from dacite import Config, from_dict
 from dotenv import load_dotenv
-from matplotlib import pyplot as plt
+import msgspec
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 
+from activities_page import ActivitiesPage
+from activity_columns import ActivityColumns
 from activity_item import ActivityItem
+from club_member import ClubMember
 from member import Member
 
 
 GG_API_BASE_URL = 'https://www.geoguessr.com/api'
 GG_CLUB_ACTIVITIES_ENDPOINT = f'{GG_API_BASE_URL}/v4/clubs/{{club_id}}/activities'
 GG_MEMBERS_ENDPOINT = f'{GG_API_BASE_URL}/v4/clubs/{{club_id}}/members'
+ACTIVITIES_PAGE_SIZE = 25
 THROTTLE_TIME_MS = 10
 FILTER_OUT_WEEKLIES = True
+PLOT_DPI = 150
+PLOT_MAX_BAR_EDGES = 60
+
+ACTIVITIES_PAGE_DECODER = msgspec.json.Decoder(ActivitiesPage)
+CLUB_MEMBERS_DECODER = msgspec.json.Decoder(list[ClubMember])
 
 
 def main():
@@ -32,16 +43,18 @@ def main():
 
     args = p.parse_args()
 
-    items = load_items(args.num_days, args.club_id)
-    plot_items(items, args.include_today_in_avg)
+    # One session for every request so its connections are reused
+    session = create_session()
+
+    activities = load_items(session, args.num_days, args.club_id)
+    plot_items(activities, args.include_today_in_avg)
     
     if args.include_member_stats:
-        members = load_members(args.club_id)
-        write_inactivity_report(items, members)
+        members = load_members(session, args.club_id)
+        write_inactivity_report(activities, members)
 
 
-def load_items(num_days: int, club_id: str) -> list[ActivityItem]:
-    
+def create_session() -> requests.Session:
     # Get the GG API key
     gg_api_key = os.getenv('GG_API_KEY')
 
@@ -51,152 +64,186 @@ def load_items(num_days: int, club_id: str) -> list[ActivityItem]:
     # Set the ncfa cookie on the session
     session.cookies.set("_ncfa", gg_api_key)
 
-    # Build the dacite config
-    dacite_config = Config(convert_key=to_camel_case)
+    # Only ask for json, compression and keep-alive are already on by default
+    session.headers.update({"Accept": "application/json"})
+
+    # Keep a small pool of persistent connections and retry transient failures
+    retries = Retry(total=3, backoff_factor=0.2, status_forcelist=[429, 502, 503, 504])
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retries))
+
+    return session
 
+
+def load_items(session: requests.Session, num_days: int, club_id: str) -> ActivityColumns:
     days_set = set()
-    all_activities = []
-    pagination_token = None
+    date_column = []
+    xp_reward = []
+    user_id = []
 
-    while len(days_set) <= num_days:
-        # Build the final url
-        activities_url = f"{GG_CLUB_ACTIVITIES_ENDPOINT.format(club_id=club_id)}?limit=25"
+    for activity in iter_activities(session, club_id):
+        # if the weekly filter is active and the entry is a weekly
+        if (FILTER_OUT_WEEKLIES and activity.xp_reward == 1000):
+            continue
 
-        if pagination_token:
-            activities_url += f"&paginationToken={pagination_token}"
+        # Get the date
+        date = activity.recorded_at.split('T')[0]
 
-        # Read the activities
-        response = session.get(activities_url)
+        # If the days set is already full and this is another day
+        if len(days_set) >= num_days and date not in days_set:
+            break
 
-        # Get json data
-        data = response.json()
+        days_set.add(date)
 
-        # Deserialize
-        activities = [from_dict(ActivityItem, item, dacite_config) for item in data['items']]
+        # Save the activity column by column, keeping the date it was bucketed by
+        date_column.append(date)
+        xp_reward.append(activity.xp_reward)
+        user_id.append(activity.user_id)
 
-        # Set the pagination token
-        pagination_token = data['paginationToken']
+    return ActivityColumns(
+        date=np.array(date_column, dtype=str),
+        xp_reward=np.array(xp_reward, dtype=np.int32),
+        user_id=np.array(user_id, dtype=str),
+    )
 
-        # Print progress
-        print('Current date: ', activities[-1].recordedAt)
 
-        # Save activities
-        for activity in activities:
-            # if the weekly filter is active and the entry is a weekly
-            if (FILTER_OUT_WEEKLIES and activity.xpReward == 1000):
-                continue
+def iter_activities(session: requests.Session, club_id: str) -> Iterator[ActivityItem]:
+    # Pages are fetched on a background thread so the next request is in flight
+    # while the current page is being processed
+    executor = ThreadPoolExecutor(max_workers=1)
 
-            # Get the date
-            date = activity.recordedAt.split('T')[0]
+    # The url prefix is the same for every page
+    base_url = f"{GG_CLUB_ACTIVITIES_ENDPOINT.format(club_id=club_id)}?limit={ACTIVITIES_PAGE_SIZE}"
 
-            # If the days set is already full and this is another day
-            if len(days_set) >= num_days and date not in days_set:
-                return all_activities
+    try:
+        # Request the first page
+        next_page = executor.submit(fetch_activities_page, session, base_url, None)
 
-            days_set.add(date)
-            all_activities.append(activity)
+        while True:
+            # Wait for the prefetched page
+            page = next_page.result()
 
-        if THROTTLE_TIME_MS:
-            # Wait before reading the next batch
-            time.sleep(THROTTLE_TIME_MS / 1000)
+            # Set the pagination token
+            pagination_token = page.pagination_token
 
-    return all_activities
+            # Prefetch the next page right away
+            if pagination_token:
+                next_page = executor.submit(fetch_activities_page, session, base_url, pagination_token)
 
+            activities = page.items
 
-def load_members(club_id: str) -> list[Member]:
-    # Create a session
-    session = requests.Session()
+            # Print progress
+            print('Current date: ', activities[-1].recorded_at)
 
-    # Get the GG API key
-    gg_api_key = os.getenv('GG_API_KEY')
+            yield from activities
 
-    # Set the ncfa cookie on the session
-    session.cookies.set("_ncfa", gg_api_key)
+            # No more pages to read
+            if not pagination_token:
+                break
+    finally:
+        # Don't wait for a prefetched page that is no longer needed
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def fetch_activities_page(session: requests.Session, base_url: str, pagination_token: str | None) -> ActivitiesPage:
+    # Build the final url
+    activities_url = base_url
+
+    if pagination_token:
+        activities_url = f"{base_url}&paginationToken={pagination_token}"
+
+        if THROTTLE_TIME_MS:
+            # Wait before reading the next batch
+            time.sleep(THROTTLE_TIME_MS / 1000)
 
     # Read the activities
-    response = session.get(GG_MEMBERS_ENDPOINT.format(club_id=club_id))
+    response = session.get(activities_url)
 
-    # Get json data
-    data = response.json()
+    # Deserialize the body straight into the typed page
+    return ACTIVITIES_PAGE_DECODER.decode(response.content)
 
-    # Build the dacite config
-    dacite_config = Config(convert_key=to_camel_case)
+
+def load_members(session: requests.Session, club_id: str) -> list[Member]:
+    # Read the activities
+    response = session.get(GG_MEMBERS_ENDPOINT.format(club_id=club_id))
 
     # Deserialize
-    members = [from_dict(Member, item["user"], dacite_config) for item in data]
+    members = [club_member.user for club_member in CLUB_MEMBERS_DECODER.decode(response.content)]
 
     return members
 
-def plot_items(items: list[ActivityItem], include_today_in_average: bool):
-    # Group by date
-    xp_by_date = defaultdict(int)
-    for item in items:
-        date = datetime.fromisoformat(item.recordedAt).date()
-        xp_by_date[date] += item.xpReward
-    
-    # Sort by date
-    dates = sorted(xp_by_date.keys())
-    xp_sums = [xp_by_date[d] for d in dates]
-    
+def plot_items(activities: ActivityColumns, include_today_in_average: bool):
+    # Import matplotlib only when plotting, the plot is only saved to a file so
+    # the non-interactive Agg backend is enough
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib import pyplot as plt
+
+    # Group by date, YYYY-MM-DD strings sort chronologically
+    dates, date_indices = np.unique(activities.date, return_inverse=True)
+    xp_sums = np.bincount(date_indices, weights=activities.xp_reward, minlength=len(dates)).astype(np.int64)
+
     xp_sums_for_avg = xp_sums
 
     if not include_today_in_average:
         xp_sums_for_avg = xp_sums[:-1]
 
     # Compute average XP
-    avg_xp = sum(xp_sums_for_avg) / len(xp_sums_for_avg)
+    avg_xp = xp_sums_for_avg.mean()
+
+    # Skip the per-bar outlines once there are too many bars to tell them apart
+    bar_edge_color = 'black' if len(dates) <= PLOT_MAX_BAR_EDGES else 'none'
 
     # Plot
     plt.figure(figsize=(8, 4))
-    plt.bar(range(len(dates)), xp_sums, width=1.0, color='skyblue', edgecolor='black')
+    plt.bar(range(len(dates)), xp_sums, width=1.0, color='skyblue', edgecolor=bar_edge_color)
     plt.axhline(avg_xp, color='red', linestyle='--', linewidth=1.5, label=f'Average ({avg_xp:.1f})')
     plt.axhline(600, color='green', linestyle=':', linewidth=1, label=f'Max')
-    plt.xticks(range(len(dates)), [d.isoformat() for d in dates], rotation=90)
+    plt.xticks(range(len(dates)), dates, rotation=90)
     plt.xlabel("Date")
     plt.ylabel("Total XP")
     plt.title("Club XP per day")
     plt.legend()
     plt.tight_layout()
-    plt.savefig("xp_per_day.png", dpi=300)
+    plt.savefig("xp_per_day.png", dpi=PLOT_DPI)
     plt.close()
 
 
-def write_inactivity_report(items: list[ActivityItem], members: list[Member], output_path: str = "inactive_members.txt"):
-    # Build lookup tables
-    user_id_to_nick = {m.userId: m.nick for m in members}
-    all_user_ids = set(user_id_to_nick.keys())
+def write_inactivity_report(activities: ActivityColumns, members: list[Member], output_path: str = "inactive_members.txt"):
+    # Build lookup tables, each member gets a dense index in userId order
+    user_id_to_nick = {m.user_id: m.nick for m in members}
+    all_user_ids = np.array(sorted(user_id_to_nick), dtype=str)
+    nicks = np.array([user_id_to_nick[user_id] for user_id in all_user_ids.tolist()], dtype=str)
 
-    # Group active userIds by date
-    active_by_date: dict[str, set[str]] = defaultdict(set)
-    for item in items:
-        date = item.recordedAt.split('T')[0]
-        active_by_date[date].add(item.userId)
+    # Map every activity to its member index, activities of non-members are dropped
+    member_indices = np.searchsorted(all_user_ids, activities.user_id)
+    is_member = member_indices < len(all_user_ids)
+    is_member[is_member] = all_user_ids[member_indices[is_member]] == activities.user_id[is_member]
 
-    # Write report
-    with open(output_path, "w", encoding="utf-8") as f:
-        for date in sorted(active_by_date.keys()):
-            inactive_user_ids = all_user_ids - active_by_date[date]
+    # Mark active members per date in a dates x members matrix
+    dates, date_indices = np.unique(activities.date, return_inverse=True)
+    active = np.zeros((len(dates), len(all_user_ids)), dtype=bool)
+    active[date_indices[is_member], member_indices[is_member]] = True
 
-            # Resolve nicks, fall back to userId if necessary
-            inactive_nicks = sorted(
-                user_id_to_nick.get(user_id, user_id)
-                for user_id in inactive_user_ids
-            )
+    # Build the report, binding the methods used per line once up front
+    lines = []
+    add_line = lines.append
+    add_lines = lines.extend
 
-            f.write(f"Date: {date}\n")
-            if inactive_nicks:
-                for nick in inactive_nicks:
-                    f.write(f"  - {nick}\n")
-            else:
-                f.write("  (No inactive members)\n")
+    for date, active_mask in zip(dates.tolist(), active):
+        inactive_nicks = sorted(nicks[~active_mask].tolist())
 
-            f.write("\n")
+        add_line(f"Date: {date}\n")
+        if inactive_nicks:
+            add_lines(map("  - {}\n".format, inactive_nicks))
+        else:
+            add_line("  (No inactive members)\n")
 
+        add_line("\n")
 
+    # Write report in one go
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write("".join(lines))
 
-def to_camel_case(key: str) -> str:
-    first_part, *remaining_parts = key.split('_')
-    return first_part + ''.join(part.title() for part in remaining_parts)
 
 
 if __name__ == '__main__':
@@ -1,7 +1,6 @@
-from dataclasses import dataclass
+import msgspec
 
 
-@dataclass
-class Member:
-    userId: str
+class Member(msgspec.Struct, rename="camel"):
+    user_id: str
     nick: str
\ No newline at end of file